@@ -0,0 +1,32 @@
+import pytest
+
+import subprocess
+import sys
+
+# Cold-start budget of each subpackage, in seconds, for the modules of the
+# package itself. numpy is the only heavy dependency loaded on import.
+budgets = {
+    "variational_circuit.vcirc": 0.05,
+    "variational_circuit.measure": 0.05,
+    "variational_circuit.optimize": 0.05,
+    "variational_circuit.service": 0.05,
+}
+heavy = ["qutip", "scipy"]
+
+def cold_import(module):
+    code = f"import sys, {module}; print(*[m for m in {heavy} if m in sys.modules])"
+    res = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                         capture_output=True, text=True, check=True)
+    self_time = 0
+    for line in res.stderr.splitlines():
+        fields = line.split("|")
+        if line.startswith("import time:") and \
+                fields[-1].strip().startswith("variational_circuit"):
+            self_time += int(fields[0].split(":")[1])
+    return res.stdout.split(), self_time*1e-6
+
+@pytest.mark.parametrize("module", budgets)
+def test_import_time(module):
+    loaded, self_time = cold_import(module)
+    assert loaded == []
+    assert self_time < budgets[module]
@@ -0,0 +1,69 @@
+import pytest
+
+import numpy as np
+
+from variational_circuit.measure import PauliSum, pauli_expect, pauli_sample
+from variational_circuit.measure import sep_purity, fid_ref, com_measure
+from variational_circuit.vcirc import Vcirc
+from variational_circuit.optimize import vcirc_test
+
+from qutip import rand_ket, ket2dm, sigmax, sigmay, sigmaz, qeye, tensor, expect
+from qutip.qip.qubits import qubit_states
+
+paulis = {'I': qeye(2), 'X': sigmax(), 'Y': sigmay(), 'Z': sigmaz()}
+strings = ["XXI", "YIZ", "ZZZ", "III", "IYX", "ZIZ"]
+coeffs = [0.3, -1.2, 0.5, 2.0, 0.7, -0.4]
+ham = sum(c*tensor([paulis[p] for p in s]) for c, s in zip(coeffs, strings))
+psi = rand_ket(8, dims=[[2]*3,[1]*3], seed=5)
+
+def test_pauli_groups():
+    hs = PauliSum(coeffs, strings)
+    assert hs.offset == 2.0
+    assert sorted(t for _, terms in hs.groups for t in terms) == [0,1,2,4,5]
+    for basis, terms in hs.groups:
+        for t in terms:
+            assert ((hs.codes[t] == 0) | (hs.codes[t] == basis)).all()
+
+def test_pauli_expect():
+    hs = PauliSum(coeffs, strings)
+    assert pauli_expect(psi, hs) == pytest.approx(expect(ham, psi))
+    assert pauli_expect(ket2dm(psi), (coeffs, strings)) == pytest.approx(expect(ham, psi))
+
+@pytest.mark.random
+def test_pauli_sample():
+    hs = PauliSum(coeffs, strings)
+    assert pauli_sample(psi, hs, sample_size=10**5) == pytest.approx(expect(ham, psi), abs=0.05)
+
+def test_pauli_zero_terms():
+    hs = PauliSum([1.0, 0.0], ["II", "XZ"])
+    assert hs.groups == []
+    assert pauli_sample(rand_ket(4, dims=[[2]*2,[1]*2], seed=1), hs, sample_size=10) == 1.0
+
+def test_single_precision():
+    outs = []
+    for dtype in (np.complex128, np.complex64):
+        vc = Vcirc(3, dtype=dtype)
+        vc.add_ansatz(np.linspace(0,1,9))
+        vc.add_ansatz(np.linspace(1,2,6), pos=[2,0])
+        outs.append(vc.apply_to(psi))
+    out, out_single = outs
+    rho = ket2dm(out_single)
+
+    for state in (out_single, rho):
+        assert sep_purity(state, [[0],[1,2]], dtype=np.complex64) \
+            == pytest.approx(sep_purity(out, [[0],[1,2]]), abs=1e-6)
+        assert fid_ref(state, qubit_states(1), [1], dtype=np.complex64) \
+            == pytest.approx(fid_ref(out, qubit_states(1), [1]), abs=1e-6)
+        assert com_measure(state, [0,2], dtype=np.complex64) \
+            == pytest.approx(com_measure(out, [0,2]), abs=1e-6)
+        assert pauli_expect(state, (coeffs, strings), dtype=np.complex64) \
+            == pytest.approx(expect(ham, out), abs=1e-6)
+
+    seen = []
+    def objective(state, parti, dtype=None):
+        seen.append(dtype)
+        return sep_purity(state, parti, dtype)
+    x = np.concatenate([np.linspace(0,1,9), np.linspace(1,2,6)])
+    value = vcirc_test(x, psi, vc, objective, None, [[0],[1,2]])
+    assert seen == [np.complex64]
+    assert value == pytest.approx(sep_purity(out, [[0],[1,2]]), abs=1e-6)
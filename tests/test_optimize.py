@@ -0,0 +1,93 @@
+import pytest
+
+import numpy as np
+
+from variational_circuit.vcirc import Vcirc, vcnot_1
+from variational_circuit.optimize import qng_metric, qng_maximize, circ_maximize
+from variational_circuit.optimize import TraceRecorder, read_trace
+from variational_circuit.measure import fid_ref
+
+from qutip import rand_ket
+from qutip.qip.qubits import qubit_states
+
+psi = rand_ket(4, dims=[[2]*2,[1]*2], seed=2)
+
+def circuit():
+    vc = Vcirc(2)
+    vc.add_ansatz(np.zeros(6))
+    vc.add_ansatz(np.zeros(1), structure=vcnot_1)
+    return vc
+
+def test_qng_metric():
+    vc = circuit()
+    x = np.linspace(0.1, 0.7, 7)
+
+    def state(x):
+        vc.update_ansatzes(x)
+        return vc.apply_to(psi).full()[:,0]
+
+    phi = state(x)
+    der = []
+    for i in range(len(x)):
+        shift = np.zeros(len(x))
+        shift[i] = 1e-5
+        der.append((state(x+shift) - state(x-shift))/2e-5)
+    der = np.array(der).T
+    exact = np.real(der.conj().T@der - np.outer(der.conj().T@phi, phi.conj()@der))
+
+    metric = qng_metric(x, psi, vc)
+    assert metric[:6,:6] == pytest.approx(exact[:6,:6], abs=1e-8)
+    assert metric[6,6] == pytest.approx(exact[6,6], abs=1e-8)
+    assert metric[:6,6] == pytest.approx(0)
+    layer = qng_metric(x, psi, vc, blocks="layer")
+    # Layers of the regular ansatz: (RZ, RY, RZ) on both qubits
+    same = np.eye(7, dtype=bool)
+    for i, j in [(0,3), (1,4), (2,5)]:
+        same[i,j] = same[j,i] = True
+    assert layer[same] == pytest.approx(exact[same], abs=1e-8)
+    assert layer[~same] == pytest.approx(0)
+
+def test_qng_maximize():
+    res = qng_maximize(np.full(7, 0.1), psi, circuit(), fid_ref, qubit_states(1), [0],
+                       lr=0.2, maxiter=30)
+    assert res.fun == pytest.approx(1, abs=1e-3)
+
+    with pytest.raises(ValueError):
+        qng_maximize(np.full(7, 0.1), psi, circuit(), fid_ref, qubit_states(1), [0],
+                     maxiter=0)
+
+def test_trace_recorder(tmp_path):
+    path = str(tmp_path / "trace.bin")
+    x0 = np.full(7, 0.1)
+    with TraceRecorder(path, 7, chunk_size=8, every=2) as recorder:
+        res = circ_maximize(x0, psi, circuit(), fid_ref, qubit_states(1), [0],
+                            recorder=recorder)
+    trace = read_trace(path)
+
+    assert len(trace) == (res.nfev + 1)//2
+    assert (trace["eval"] == np.arange(0, res.nfev, 2)).all()
+    assert (trace["x"][0] == x0).all()
+    assert trace["fun"].max() <= res.fun + 1e-12
+    assert (trace["t_simulate"] > 0).all()
+
+    with TraceRecorder(path, 7) as recorder:
+        qng_maximize(x0, psi, circuit(), fid_ref, qubit_states(1), [0],
+                     recorder=recorder, maxiter=2)
+    resumed = read_trace(path)
+    assert len(resumed) > len(trace)
+    assert (np.diff(resumed["eval"]) > 0).all()
+
+    recorder = TraceRecorder(path, 7)
+    recorder.record(x0, 0.)
+    del recorder    # the buffer is flushed on collection
+    assert len(read_trace(path)) == len(resumed) + 1
+
+    with open(path, "ab") as f:
+        f.write(b"\0"*10)       # partial record of an interrupted flush
+    with TraceRecorder(path, 7) as recorder:
+        recorder.record(x0, 1.)
+    last = read_trace(path)[-1]
+    assert last["fun"] == 1. and last["eval"] == resumed["eval"][-1] + 2
+    assert not np.isnan(read_trace(path)["grad_norm"]).all()
+    with pytest.raises(ValueError):
+        TraceRecorder(path, 6)
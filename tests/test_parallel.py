@@ -0,0 +1,46 @@
+import pytest
+
+import numpy as np
+
+from variational_circuit import parallel
+from variational_circuit.vcirc import Vcirc
+from variational_circuit.measure import sep_purity, fid_ref, com_measure
+
+from qutip import rand_ket
+from qutip.qip.qubits import qubit_states
+
+psi = rand_ket(2**6, dims=[[2]*6,[1]*6], seed=3)
+
+def evaluate():
+    vc = Vcirc(6)
+    vc.add_ansatz(np.linspace(0,1,18))
+    vc.add_ansatz(np.linspace(1,2,9), pos=[4,1,3])
+    out = vc.apply_to(psi)
+    return out, [sep_purity(out,[[0,2],[1,3,4,5]]), fid_ref(out,qubit_states(2),[1,5]),
+                 *com_measure(out,[0,4])]
+
+@pytest.fixture
+def threads():
+    parallel.set_threads(3, threshold=8)
+    yield
+    parallel.set_threads(1)
+
+def test_threaded_kernels(threads):
+    out, values = evaluate()
+    parallel.set_threads(1)
+    out_serial, values_serial = evaluate()
+
+    assert np.allclose(out.full(), out_serial.full())
+    assert values == pytest.approx(values_serial)
+
+def test_threaded_ket(threads, monkeypatch):
+    calls = []
+    _map = parallel._map
+    monkeypatch.setattr(parallel, "_map",
+                        lambda func, blocks: calls.append(blocks) or _map(func, blocks))
+    vc = Vcirc(6)
+    vc.add_ansatz(np.linspace(0,1,18))      # a single column on the register
+    out = vc.apply_to(psi)
+
+    assert len(calls) > 0
+    assert np.allclose(out.full(), (vc.compress()[0]*psi).full())
@@ -0,0 +1,84 @@
+import pytest
+
+import asyncio
+import numpy as np
+
+from variational_circuit.vcirc import Vcirc
+from variational_circuit.service import EvaluationService
+from variational_circuit.optimize import vcirc_test
+from variational_circuit.measure import fid_ref
+
+from qutip import rand_ket, ket2dm
+from qutip.qip.qubits import qubit_states
+
+inputs = [rand_ket(8, dims=[[2]*3,[1]*3], seed=i) for i in range(4)]
+xs = [np.linspace(0, i, 15) for i in range(4)]
+
+def circuit():
+    vc = Vcirc(3)
+    vc.add_ansatz(np.zeros(9))
+    vc.add_ansatz(np.zeros(6), pos=[2,0])
+    return vc
+
+def expected(x, state):
+    return vcirc_test(x, state, circuit(), fid_ref, None,
+                      qubit_states(1), [1])
+
+def test_async_batch():
+    async def run():
+        async with EvaluationService(window=0.05) as service:
+            values = await asyncio.gather(*[
+                service.evaluate(x, state, circuit(), fid_ref, qubit_states(1), [1])
+                for x, state in zip(xs, inputs)])
+            return values, service.stats
+
+    values, stats = asyncio.run(run())
+    assert values == pytest.approx([expected(x, s) for x, s in zip(xs, inputs)])
+    assert stats["requests"] == 4
+    assert stats["max_batch_size"] == 4
+
+def test_sync_objective():
+    with EvaluationService() as service:
+        fun = service.objective(ket2dm(inputs[0]), circuit(), fid_ref,
+            qubit_states(1), [1], negate=True)
+        assert fun(xs[1]) == pytest.approx(-expected(xs[1], inputs[0]))
+        with pytest.raises(ValueError):
+            fun(np.zeros(3))
+
+def test_bad_requests():
+    async def run():
+        async with EvaluationService(window=0.05) as service:
+            requests = [
+                service.evaluate(xs[0], inputs[0].full(), circuit(), fid_ref, qubit_states(1), [1]),
+                service.evaluate(np.zeros(3), inputs[1], circuit(), fid_ref, qubit_states(1), [1]),
+                service.evaluate(xs[2], inputs[2], circuit(), fid_ref, qubit_states(1), [1]),
+            ]
+            first = await asyncio.gather(*requests, return_exceptions=True)
+            after = await service.evaluate(xs[3], inputs[3], circuit(), fid_ref,
+                                           qubit_states(1), [1])
+            return first, after
+
+    (bad_state, bad_x, good), after = asyncio.run(run())
+    assert isinstance(bad_state, TypeError)
+    assert isinstance(bad_x, ValueError)
+    assert good == pytest.approx(expected(xs[2], inputs[2]))
+    assert after == pytest.approx(expected(xs[3], inputs[3]))
+
+def test_pending_requests_fail_on_close():
+    async def run():
+        async with EvaluationService(window=10) as service:
+            task = asyncio.ensure_future(service.evaluate(xs[0], inputs[0],
+                circuit(), fid_ref, qubit_states(1), [1]))
+            await asyncio.sleep(0.05)
+        return await asyncio.wait_for(asyncio.gather(task,
+            return_exceptions=True), 1)
+
+    assert isinstance(asyncio.run(run())[0], RuntimeError)
+
+    service = EvaluationService(window=10)
+    service.start()
+    future = service.submit(xs[0], inputs[0], circuit(), fid_ref,
+                            qubit_states(1), [1])
+    service.stop()
+    with pytest.raises(RuntimeError):
+        future.result(timeout=1)
@@ -0,0 +1,108 @@
+import pytest
+
+import numpy as np
+
+from variational_circuit.vcirc import Vcirc, Ansatz, local, vcnot_1, vcnot_2
+
+from qutip import rand_ket, ket2dm
+from qutip.qip.operations.gates import expand_operator
+
+psi = rand_ket(16, dims=[[2]*4,[1]*4], seed=7)
+
+def test_subsystem_ansatz():
+    x = np.linspace(0,1,6)
+    vc = Vcirc(4)
+    vc.add_ansatz(x, pos=[3,1])
+    local = Ansatz(x, 2)
+    op = expand_operator(local.unitary[0], 4, [3,1])
+
+    assert (vc.apply_to(psi) - op*psi).norm() == pytest.approx(0)
+    assert (vc.compress()[0] - op).norm() == pytest.approx(0)
+    assert [gate.targets for gate in vc.gates] == \
+        [[[3,1][q] for q in gate.targets] for gate in local.gates]
+
+def test_stat_deprecated():
+    vc = Vcirc(4)
+    vc.add_ansatz(np.linspace(0,1,6), pos=[3,1])
+
+    with pytest.warns(DeprecationWarning):
+        out = vc.apply_to(psi, stat=True)
+    assert (out - vc.apply_to(psi)).norm() == pytest.approx(0)
+    with pytest.warns(DeprecationWarning):
+        sim = vc.sim
+    assert (sim.ops[0] - vc.unitary[0]).norm() == pytest.approx(0)
+    assert Vcirc(4).result is None
+
+def test_placed_gates():
+    vc = Vcirc(4)
+    vc.add_ansatz(np.zeros(6), pos=[3,1])
+    vc.compress()
+    gates = list(vc.gates)
+    vc.update_ansatzes(np.ones(6))
+    vc.compress()
+
+    assert all(a is b for a, b in zip(gates, vc.gates))
+    assert [gate.arg_value for gate in vc.gates if gate.arg_value is not None] \
+        == [1]*6
+
+def test_density_matrix_input():
+    vc = Vcirc(4)
+    vc.add_ansatz(np.linspace(0,1,12))
+    vc.add_ansatz(np.linspace(1,2,6), pos=[0,2])
+    out = vc.apply_to(psi)
+
+    assert (vc.apply_to(ket2dm(psi)) - ket2dm(out)).norm() == pytest.approx(0)
+
+def test_update_outdates_operator():
+    vc = Vcirc(4)
+    vc.add_ansatz(np.zeros(6), structure=local, pos=[0,1])
+    assert (vc.apply_to(psi) - psi).norm() == pytest.approx(0)
+    vc.update_ansatzes(np.ones(6))
+    assert (vc.apply_to(psi) - psi).norm() > 1e-3
+
+def test_light_cone():
+    vc = Vcirc(4)
+    vc.add_ansatz(np.linspace(0,1,6), pos=[0,1])
+    vc.add_ansatz(np.linspace(1,2,6), pos=[2,3])
+    vc.add_ansatz(np.linspace(0,1,12), structure=local)
+    cone = vc.light_cone([1])
+
+    assert cone.support == [0,1]
+    assert cone.plan[1][1] == [3,4,5]    # gates of the last ansatz on qubit 1
+    assert (vc.apply_to(psi,targets=[1]) - vc.apply_to(psi).ptrace([1])).norm() \
+        == pytest.approx(0)
+
+def test_light_cone_idle_qubit():
+    vc = Vcirc(4)
+    vc.add_ansatz(np.linspace(0,1,12), structure=local)
+    vc.add_ansatz([0.3], structure=vcnot_1, pos=[3,0,2])   # qubit 2 is idle
+    cone = vc.light_cone([0])
+
+    assert cone.support == [0,3]
+    assert (vc.apply_to(psi,targets=[0]) - vc.apply_to(psi).ptrace([0])).norm() \
+        == pytest.approx(0)
+
+def test_large_light_cone():
+    N = 12
+    vc = Vcirc(N)
+    for pos in [list(range(6,11)), list(range(3,8)), list(range(0,5))]:
+        vc.add_ansatz(np.linspace(0,1,3*len(pos)), pos=pos)
+    phi = rand_ket(2**N, dims=[[2]*N,[1]*N], seed=3)
+
+    assert len(vc.light_cone([0]).support) == 11
+    assert (vc.apply_to(phi,targets=[0]) - vc.apply_to(phi).ptrace([0])).norm() \
+        == pytest.approx(0)
+
+def test_light_cone_bra():
+    vc = Vcirc(4)
+    vc.add_ansatz(np.linspace(0,1,6), pos=[0,1])
+    vc.add_ansatz(np.linspace(1,2,6), pos=[2,3])
+
+    assert (vc.apply_to(psi.dag(),targets=[1]) - vc.apply_to(psi).ptrace([1])).norm() \
+        == pytest.approx(0)
+
+def test_empty_ansatz():
+    vc = Vcirc(4)
+    vc.add_ansatz([], structure=vcnot_2, pos=[1,3])     # no gates on 2 qubits
+
+    assert (vc.apply_to(psi) - psi).norm() == pytest.approx(0)
@@ -0,0 +1,30 @@
+import importlib
+import sys
+
+
+def lazy_attributes(module:str, attributes:dict):
+    """
+    Module level `__getattr__` and `__dir__` (PEP 562), which import the
+    module defining an attribute on its first access.
+
+    Parameters
+    ----------
+    module: str
+        Name of the module, i.e. `__name__`.
+    attributes: dict
+        Name of the module defining each attribute, relative to the package
+        of `module` (e.g. ".base").
+    """
+    def __getattr__(name):
+        if name not in attributes:
+            raise AttributeError(f"module {module!r} has no attribute {name!r}")
+        source = importlib.import_module(attributes[name],
+                                         sys.modules[module].__package__)
+        value = getattr(source, name)
+        setattr(sys.modules[module], name, value)   # later access is direct
+        return value
+
+    def __dir__():
+        return sorted(set(vars(sys.modules[module])) | set(attributes))
+
+    return __getattr__, __dir__
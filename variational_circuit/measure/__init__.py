@@ -1,2 +1,17 @@
-from .measure_sample import dst,hst
-from .measure_sim import sep_purity, fid_ref, c_entropy, com_measure
\ No newline at end of file
+from .._lazy import lazy_attributes
+
+# The measures depend on qutip and scipy, which are imported on first use
+__all__ = ["dst", "hst", "pauli_sample",
+           "sep_purity", "fid_ref", "c_entropy", "com_measure",
+           "PauliSum", "pauli_expect"]
+__getattr__, __dir__ = lazy_attributes(__name__, {
+    "dst": ".measure_sample",
+    "hst": ".measure_sample",
+    "pauli_sample": ".measure_sample",
+    "sep_purity": ".measure_sim",
+    "fid_ref": ".measure_sim",
+    "c_entropy": ".measure_sim",
+    "com_measure": ".measure_sim",
+    "PauliSum": ".measure_sim",
+    "pauli_expect": ".measure_sim",
+})
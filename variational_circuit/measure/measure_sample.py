@@ -1,6 +1,6 @@
 import numpy as np
 
-from .measure_sim import com_measure
+from .measure_sim import com_measure, PauliSum
 
 from qutip import Qobj, state_index_number, state_number_index
 from qutip.qip.operations.gates import gate_sequence_product
@@ -94,4 +94,25 @@ def dst_source(pre_ps: callable,parti=None,sample_size=1,args=()):
 def hst(state,qc,sample_size=1):
     sample = hst_measurement(state,qc,sample_size)
     dist = sample.count(0)/len(sample)
-    return dist
\ No newline at end of file
+    return dist
+
+def pauli_sample(state,hamiltonian,sample_size=1):
+    """
+    Sampled expectation value of a Pauli sum.
+    The samples are allocated to the commuting groups in proportion to the
+    weights of the groups, with at least one sample per group, so up to one
+    sample per group more than `sample_size` can be drawn in total.
+    """
+    if not isinstance(hamiltonian, PauliSum):
+        hamiltonian = PauliSum(*hamiltonian)
+    weights = hamiltonian.weights
+    if len(weights) == 0:
+        return hamiltonian.offset
+    shots = np.maximum(1, np.round(sample_size*weights/weights.sum())).astype(int)
+
+    probs = hamiltonian.probabilities(state)
+    value = hamiltonian.offset
+    for prob, diag, n in zip(probs, hamiltonian.diagonals, shots):
+        counts = np.random.multinomial(n, prob/prob.sum())
+        value += counts @ diag / n
+    return value
@@ -1,19 +1,101 @@
+from __future__ import annotations
+
 import numpy as np
 from collections.abc import Iterable
+from typing import TYPE_CHECKING
+
+from ..parallel import enabled, reduce
 
-from qutip.metrics import fidelity
-from qutip.qip.circuit import CircuitSimulator, QubitCircuit
-from qutip import Qobj
-from scipy.stats import entropy
+# qutip and scipy are imported on first use
+if TYPE_CHECKING:
+    from qutip import Qobj
 
 
-def com_measure(state, sel=None):
+############ Precision ##################
+
+def _reduced(state, sel=None, dtype=np.complex64):
+    """
+    Reduced state of the subsystems `sel` as an array of precision `dtype`.
+
+    Kets are returned as the matrix `M` of shape (dim_sel, dim_rest), the
+    reduced density matrix being `M M^dag`, so that the full density matrix
+    is never formed. Density matrices are returned as the reduced density
+    matrix, the partial trace being summed in precision `dtype`.
+
+    Return
+    ------
+        (`M` or `rho`, `state.isoper`)
+    """
+    dims = state.dims[0] if not state.isbra else state.dims[1]
+    N = len(dims)
+    sel = list(range(N)) if sel is None else sorted(sel)
+    rest = [i for i in range(N) if i not in sel]
+    dim_sel = int(np.prod([dims[i] for i in sel]))
+    dim_rest = int(np.prod([dims[i] for i in rest]))
+
+    data = state.full().astype(dtype, copy=False)
+    if state.isket or state.isbra:
+        if state.isbra:
+            data = data.conj()
+        mat = data.reshape(dims).transpose(sel + rest)
+        return mat.reshape(dim_sel, dim_rest), False
+    elif state.isoper:
+        if len(rest) == 0:
+            return data, True
+        perm = sel + rest
+        mat = data.reshape(dims + dims).transpose(perm + [N + i for i in perm])
+        mat = mat.reshape(dim_sel, dim_rest, dim_sel, dim_rest)
+        return np.einsum('ijkj->ik', mat), True
+    else:
+        raise ValueError("Invalid input state.")
+
+def _threaded(state, dtype):
+    """
+    The precision of the numpy reductions. Large states use them in double
+    precision when the threaded kernels are enabled.
+    """
+    if dtype is None and enabled(np.prod(state.shape)):
+        return np.complex128
+    return dtype
+
+def _square_sum(block):
+    return np.sum(np.abs(block)**2, dtype=np.float64)
+
+def _purity(state, sel=None, dtype=np.complex64):
+    """
+    Purity of a subsystem. The reduced state is formed in precision `dtype`,
+    only the final sum is accumulated in double precision.
+    """
+    mat, isoper = _reduced(state, sel, dtype)
+    if not isoper:
+        # M M^dag and M^dag M share the purity, use the smaller one
+        if mat.shape[0] <= mat.shape[1]:
+            mat = reduce(lambda b: b @ b.conj().T, mat, axis=1)
+        else:
+            mat = reduce(lambda b: b.conj().T @ b, mat, axis=0)
+    return float(reduce(_square_sum, mat, axis=0))
+
+def com_measure(state, sel=None, dtype=None):
     """
     Measurement in computational basis
+
+    If `dtype` is given, e.g. `np.complex64`, the distribution is computed
+    with arrays of this precision and accumulated in double precision.
     """
+    from qutip import Qobj
+    from qutip.qip.circuit import CircuitSimulator, QubitCircuit
+
     if not isinstance(state, Qobj):
         raise TypeError("Input must be a Qobj")
 
+    dtype = _threaded(state, dtype)
+    if dtype is not None and (state.type == "ket" or state.type == "oper"):
+        mat, isoper = _reduced(state, sel, dtype)
+        if isoper:
+            return np.real(np.diagonal(mat)).astype(np.float64)
+        return reduce(lambda b: np.sum(np.abs(b)**2, axis=1, dtype=np.float64),
+                      mat, axis=1)
+
     if state.type == "ket" or state.type == "oper":
         if isinstance(sel,Iterable):
             N = len(sel)
@@ -32,8 +114,13 @@ def com_measure(state, sel=None):
 
 ############ Test Functions ##################
 
-def sep_purity(state,parti=None):
+def sep_purity(state,parti=None,dtype=None):
     """Purity of the disentangled system"""
+    dtype = _threaded(state, dtype)
+    if dtype is not None:
+        if parti == None:
+            return _purity(state, None, dtype)
+        return np.prod([_purity(state, part, dtype) for part in parti])
     if parti == None:
         return state.purity()
     purity = 1
@@ -41,22 +128,197 @@ def sep_purity(state,parti=None):
         purity = purity*state.ptrace(part).purity()
     return purity
 
-def c_entropy(state,target=None,log_base=2):
+def c_entropy(state,target=None,log_base=2,dtype=None):
     """Entropy of the computational basis output"""
+    from scipy.stats import entropy
+
+    dtype = _threaded(state, dtype)
+    if dtype is not None:
+        return entropy(com_measure(state,target,dtype),base=log_base)
     if target!=None:
         state = state.ptrace(target)
     return entropy(com_measure(state),base=log_base)
 
-def fid_ref(state,r_state,ref_sys=None):
+def fid_ref(state,r_state,ref_sys=None,dtype=None):
     """The fidelity between subsystem and the reference state"""
+    from qutip.metrics import fidelity
+
     if ref_sys != None:
         n = len(ref_sys)
     else:
         n = len(state.dims[0])
     if (r_state.dims[0] != [2]*n) and (r_state.dims[1] != [2]*n):
         raise ValueError("Invalid reference state, must be state on %s qubits system." % n)
+    dtype = _threaded(state, dtype)
+    if dtype is not None:
+        return _fidelity(state,r_state,ref_sys,dtype)
     state_test = state
     if ref_sys != None:
         state_test = state.ptrace(ref_sys)
     fid = fidelity(state_test,r_state)
-    return fid
\ No newline at end of file
+    return fid
+
+def _fidelity(state,r_state,ref_sys,dtype):
+    """`fid_ref` with arrays of precision `dtype`, accumulated in double"""
+    from qutip import Qobj
+    from qutip.metrics import fidelity
+
+    mat, isoper = _reduced(state, ref_sys, dtype)
+    if r_state.isket or r_state.isbra:
+        ref = r_state.full().ravel()
+        if r_state.isbra:
+            ref = ref.conj()
+        ref = ref.astype(dtype)
+        if not isoper and mat.shape[1] == 1:    # pure state, no reduction
+            return abs(reduce(lambda r, b: np.sum(r.conj()*b, dtype=np.complex128),
+                              ref, mat[:, 0], axis=0))
+        if isoper:
+            val = reduce(lambda r, b: np.sum(r.conj()[:, None]*b*ref[None, :],
+                                             dtype=np.complex128),
+                         ref, mat, axis=0)
+        else:
+            val = reduce(lambda b: _square_sum(ref.conj() @ b), mat, axis=1)
+        return float(np.sqrt(max(np.real(val), 0)))
+    # Mixed reference, the reduced state is small enough for double precision
+    if not isoper:
+        mat = mat @ mat.conj().T
+    rho = Qobj(mat.astype(np.complex128), dims=r_state.dims)
+    return fidelity(rho, r_state)
+
+############ Pauli Sums ##################
+
+_pauli_codes = {'I': 0, 'X': 1, 'Y': 2, 'Z': 3}
+
+_hadamard = np.array([[1, 1], [1, -1]]) / np.sqrt(2)
+_rotations = [
+    np.eye(2),                              # I
+    _hadamard,                              # X -> Z
+    _hadamard @ np.diag([1, -1j]),          # Y -> Z
+    np.eye(2),                              # Z
+]
+
+class PauliSum:
+    """
+    A Hamiltonian given as a weighted sum of Pauli strings.
+
+    The terms are split into qubit-wise commuting groups. Each group is
+    measured in a single product basis, in which all its terms are diagonal,
+    so a group is evaluated with one basis rotation and one contraction of
+    the probabilities with the precomputed diagonal of the group.
+
+    Parameters
+    ----------
+    coeffs: list
+        Real coefficients of the terms.
+    strings: list
+        Pauli strings, either as strings such as "XIZ" or as lists of codes
+        0, 1, 2, 3 for I, X, Y, Z. The i-th letter acts on the i-th qubit.
+    """
+    def __init__(self, coeffs, strings):
+        codes = []
+        for string in strings:
+            if isinstance(string, str):
+                try:
+                    string = [_pauli_codes[p] for p in string.upper()]
+                except KeyError:
+                    raise ValueError(f"Invalid Pauli string {string}.")
+            codes.append(string)
+        codes = np.array(codes, dtype=int)
+        coeffs = np.array(coeffs, dtype=float)
+
+        if codes.ndim != 2 or len(codes) != len(coeffs):
+            raise ValueError("Each coefficient requires a Pauli string of \
+the same length.")
+        if codes.min() < 0 or codes.max() > 3:
+            raise ValueError("Pauli codes must be 0, 1, 2 or 3.")
+
+        self.N = codes.shape[1]
+        self.coeffs = coeffs
+        self.codes = codes
+
+        identity = (codes == 0).all(axis=1)
+        self.offset = coeffs[identity].sum()
+
+        # Greedy grouping, largest terms first, terms of zero weight dropped
+        self.groups = []    # list of (basis, index of the terms)
+        terms = np.nonzero(~identity & (coeffs != 0))[0]
+        for t in sorted(terms, key=lambda t: -abs(coeffs[t])):
+            for basis, terms in self.groups:
+                if ((codes[t] == 0) | (basis == 0) | (codes[t] == basis)).all():
+                    basis[codes[t] != 0] = codes[t][codes[t] != 0]
+                    terms.append(t)
+                    break
+            else:
+                self.groups.append((codes[t].copy(), [t]))
+
+        self.diagonals = [self.__diagonal(terms) for _, terms in self.groups]
+
+    def __diagonal(self, terms) -> np.ndarray:
+        """Diagonal of the group in its measurement basis"""
+        diag = np.zeros(2**self.N)
+        for t in terms:
+            term = np.ones(1)
+            for code in self.codes[t]:
+                term = np.kron(term, [1, 1] if code == 0 else [1, -1])
+            diag += self.coeffs[t] * term
+        return diag
+
+    @property
+    def weights(self) -> np.ndarray:
+        """Sum of the absolute coefficients of each group"""
+        return np.array([np.abs(self.coeffs[terms]).sum()
+                         for _, terms in self.groups])
+
+    def probabilities(self, state: Qobj, dtype=np.complex128) -> list:
+        """
+        Probability distributions of the state measured in the basis of
+        each group, computed with arrays of precision `dtype`.
+        """
+        from qutip import Qobj
+
+        if not isinstance(state, Qobj):
+            raise TypeError("Input must be a Qobj")
+        if len(state.dims[0]) != self.N:
+            raise ValueError(f"Invalid input state, must be state on {self.N} \
+qubits system.")
+
+        N = self.N
+        if state.isket or state.isbra:
+            vec = state.full().astype(dtype, copy=False).reshape([2]*N)
+            if state.isbra:
+                vec = vec.conj()
+        elif state.isoper:
+            mat = state.full().astype(dtype, copy=False).reshape([2]*(2*N))
+        else:
+            raise ValueError("Invalid input state.")
+
+        probs = []
+        for basis, _ in self.groups:
+            if state.isoper:
+                out = mat
+                for q in np.nonzero((basis == 1) | (basis == 2))[0]:
+                    rot = _rotations[basis[q]].astype(dtype)
+                    out = np.moveaxis(np.tensordot(rot, out, axes=(1, q)), 0, q)
+                    out = np.moveaxis(
+                        np.tensordot(out, rot.conj().T, axes=(N+q, 0)), -1, N+q)
+                prob = np.real(np.diagonal(out.reshape(2**N, 2**N)))
+            else:
+                out = vec
+                for q in np.nonzero((basis == 1) | (basis == 2))[0]:
+                    out = np.moveaxis(np.tensordot(
+                        _rotations[basis[q]].astype(dtype), out, axes=(1, q)), 0, q)
+                prob = np.abs(out.reshape(-1))**2
+            probs.append(prob)
+        return probs
+
+def pauli_expect(state, hamiltonian, dtype=np.complex128):
+    """
+    Expectation value of a Pauli sum.
+    The contraction with the diagonals is accumulated in double precision.
+    """
+    if not isinstance(hamiltonian, PauliSum):
+        hamiltonian = PauliSum(*hamiltonian)
+    probs = hamiltonian.probabilities(state, dtype)
+    return hamiltonian.offset + sum(
+        prob.astype(np.float64) @ diag
+        for prob, diag in zip(probs, hamiltonian.diagonals))
@@ -1,9 +1,26 @@
-from scipy.optimize import minimize
+from __future__ import annotations
 
-from .vcirc.base import Vcirc
-from .measure.measure_sample import dst,hst,dst_source
+import os
+import time
+import inspect
+import numpy as np
+from typing import TYPE_CHECKING
+
+from ._lazy import lazy_attributes
+from .vcirc.placement import Placement
+from .vcirc.gates import generators, gate_qubits
 from .measure.measure_sim import sep_purity, fid_ref, c_entropy
 
+# scipy and qutip are imported on first use
+if TYPE_CHECKING:
+    from .vcirc.base import Vcirc
+__getattr__, __dir__ = lazy_attributes(__name__, {
+    "Vcirc": ".vcirc.base",
+    "dst": ".measure.measure_sample",
+    "hst": ".measure.measure_sample",
+    "dst_source": ".measure.measure_sample",
+})
+
 def  vcirc_test(
         x,
         statein,
@@ -13,13 +30,7 @@ def  vcirc_test(
         *args,
         **kwargs):
 
-    vcirc.update_ansatzes(x,ansatz_li)
-    N = vcirc.N
-    if (statein.dims[0] != [2]*N):
-        raise ValueError("Invalid input state, must be state on %s qubits system." % N)
-
-    stateout = vcirc.apply_to(statein)
-    return test_func(stateout,*args,**kwargs)
+    return __evaluate(x,statein,vcirc,test_func,ansatz_li,args,kwargs)
 
 def  __vcirc_test_neg(
         x,
@@ -30,13 +41,52 @@ def  __vcirc_test_neg(
         *args,
         **kwargs):
 
+    return -__evaluate(x,statein,vcirc,test_func,ansatz_li,args,kwargs)
+
+def __evaluate(x, statein, vcirc, test_func, ansatz_li, args, kwargs=None,
+        targets=None, recorder=None):
+    """
+    `vcirc_test` restricted to the light cone of `targets`, the value and the
+    time of each phase being written to `recorder`. The precision of `vcirc`
+    is passed to `test_func` if it takes a `dtype` not given by the caller.
+    """
+    kwargs = dict(kwargs or {})
+    if vcirc.dtype != np.complex128 and "dtype" not in kwargs and \
+            __takes_dtype(test_func, len(args)):
+        kwargs["dtype"] = vcirc.dtype
+
+    t0 = time.perf_counter()
     vcirc.update_ansatzes(x,ansatz_li)
     N = vcirc.N
     if (statein.dims[0] != [2]*N):
         raise ValueError("Invalid input state, must be state on %s qubits system." % N)
 
-    stateout = vcirc.apply_to(statein)
-    return -test_func(stateout,*args,**kwargs)
+    t1 = time.perf_counter()
+    stateout = vcirc.apply_to(statein,targets=targets)
+    t2 = time.perf_counter()
+    value = test_func(stateout,*args,**kwargs)
+    if recorder is not None:
+        recorder.record(x, value, (t1-t0, t2-t1, time.perf_counter()-t2))
+    return value
+
+def __takes_dtype(func, nargs:int) -> bool:
+    """Whether `func(state, *args)` leaves a `dtype` argument free"""
+    try:
+        params = list(inspect.signature(func).parameters.values())
+    except (TypeError, ValueError):
+        return False
+    for i, param in enumerate(params):
+        if param.name == "dtype":
+            return param.kind == param.KEYWORD_ONLY or \
+                (param.kind == param.POSITIONAL_OR_KEYWORD and i > nargs)
+    return False
+
+def __objective(targets, recorder, sign=1):
+    """Objective for `minimize`, with the arguments of `vcirc_test`"""
+    def fun(x, statein, vcirc, test_func=sep_purity, ansatz_li=None, *args):
+        return sign*__evaluate(x,statein,vcirc,test_func,ansatz_li,args,
+                               targets=targets,recorder=recorder)
+    return fun
 
 def circ_minimize(
         x0,
@@ -45,10 +95,19 @@ def circ_minimize(
         test_func=sep_purity,
         *args,
         ansatz_li=None,
+        targets=None,
+        recorder=None,
         opt_method="BFGS",
         jac=None, hess=None, hessp=None, bounds=None,
         constraints=(), tol=None, callback=None, options=None):
-    res = minimize(vcirc_test,x0,(statein,vcirc,test_func,ansatz_li)+args,opt_method,
+    from scipy.optimize import minimize
+
+    fun = vcirc_test
+    if targets is not None or recorder is not None:
+        fun = __objective(targets, recorder)
+    if recorder is not None and callable(jac):
+        jac = recorder.watch(jac)
+    res = minimize(fun,x0,(statein,vcirc,test_func,ansatz_li)+args,opt_method,
                    jac, hess, hessp, bounds, constraints, tol, callback, options)
     return res
 
@@ -59,10 +118,398 @@ def circ_maximize(
         test_func=sep_purity,
         *args,
         ansatz_li=None,
+        targets=None,
+        recorder=None,
         opt_method="BFGS",
         jac=None, hess=None, hessp=None, bounds=None,
         constraints=(), tol=None, callback=None, options=None):
-    res = minimize(__vcirc_test_neg,x0,(statein,vcirc,test_func,ansatz_li)+args,opt_method,
+    from scipy.optimize import minimize
+
+    fun = __vcirc_test_neg
+    if targets is not None or recorder is not None:
+        fun = __objective(targets, recorder, sign=-1)
+    if recorder is not None and callable(jac):
+        jac = recorder.watch(jac)
+    res = minimize(fun,x0,(statein,vcirc,test_func,ansatz_li)+args,opt_method,
                    jac, hess, hessp, bounds, constraints, tol, callback, options)
     res.fun = -res.fun
-    return res
\ No newline at end of file
+    return res
+
+############ Quantum Natural Gradient ##################
+
+def __metric_block(cols):
+    """Fubini-Study metric from the state and its derivatives"""
+    phi = cols[:, :1]
+    der = cols[:, 1:]
+    overlap = der.conj().T @ phi
+    return np.real(der.conj().T @ der - overlap @ overlap.conj().T)
+
+def qng_metric(x, statein, vcirc: Vcirc, blocks="ansatz"):
+    """
+    Block-diagonal Fubini-Study metric of the variational circuit.
+
+    The derivatives of the state are obtained from the generators of the
+    gates and are propagated together with the state through each block, so
+    a single pass over the circuit is needed.
+
+    Parameters
+    ----------
+    x: list
+        Parameters of the circuit.
+    statein: Qobj
+        Pure input state.
+    vcirc: Vcirc
+        The variational circuit.
+    blocks: str
+        "ansatz" for one block per ansatz, or "layer" for one block per
+        layer of commuting gates in each ansatz, a gate being one layer
+        deeper than the last gate on its qubits.
+
+    Return
+    ------
+        The metric as a square matrix, in the order of the parameters.
+    """
+    if blocks not in ("ansatz", "layer"):
+        raise ValueError("blocks must be 'ansatz' or 'layer'.")
+    if not statein.isket:
+        raise ValueError("The quantum natural gradient requires a pure input state.")
+
+    vcirc.update_ansatzes(x)
+    state = statein.full()
+    num_paras = sum(len(ansatz.paras) for ansatz in vcirc.ansatzes)
+    metric = np.zeros((num_paras, num_paras))
+    head = 0
+    for ansatz in vcirc.ansatzes:
+        gates = ansatz.gates
+        props = ansatz.propagators()
+        index = []          # Position of the parameter of each gate in x
+        for gate in gates:
+            index.append(head if gate.arg_value is not None else None)
+            head += gate.arg_value is not None
+
+        if blocks == "ansatz":
+            layers = [list(range(len(gates)))]
+        else:
+            # A gate is one layer deeper than the last gate on its qubits,
+            # the gates of a layer act on distinct qubits and commute
+            depth = {}
+            layer_of = []
+            for gate in gates:
+                qubits = gate_qubits(gate)
+                layer = 1 + max((depth.get(q, 0) for q in qubits), default=0)
+                depth.update((q, layer) for q in qubits)
+                layer_of.append(layer)
+            layers = {}
+            for j, layer in enumerate(layer_of):
+                layers.setdefault(layer, []).append(j)
+            layers = [layers[layer] for layer in sorted(layers)]
+
+        for layer in layers:
+            cols = state    # The state and its derivatives in the block
+            ids = []
+            for j in layer:
+                gate = gates[j]
+                cols = ansatz.placement.apply(props[j].full(), cols)
+                if index[j] is None:
+                    continue
+                if gate.name == "GLOBALPHASE":
+                    der = 1j*cols[:, :1]
+                elif gate.name in generators:
+                    placement = Placement(vcirc.dims,
+                        [ansatz.pos[q] for q in gate_qubits(gate)])
+                    der = -1j*placement.apply(generators[gate.name], cols[:, :1])
+                else:
+                    raise ValueError(f"The metric of the gate {gate.name} \
+is not supported.")
+                cols = np.hstack([cols, der])
+                ids.append(index[j])
+            if ids:
+                metric[np.ix_(ids, ids)] = __metric_block(cols)
+            state = cols[:, :1]
+
+    return metric
+
+def __natural_gradient(fun, x0, statein, vcirc, jac, lr, reg, metric_step,
+        blocks, eps, maxiter, tol, callback, recorder=None, sign=1):
+    from scipy.optimize import OptimizeResult
+
+    if maxiter < 1:
+        raise ValueError("The maximal number of iterations must be positive.")
+    x = np.array(x0, dtype=float)
+    nfev = 0
+
+    def grad(x):
+        nonlocal nfev
+        if jac is not None:
+            return np.asarray(jac(x))
+        g = np.zeros(len(x))
+        for i in range(len(x)):
+            shift = np.zeros(len(x))
+            shift[i] = eps
+            g[i] = (fun(x+shift) - fun(x-shift))/(2*eps)
+        nfev += 2*len(x)
+        return g
+
+    f = fun(x)
+    nfev += 1
+    success = False
+    for nit in range(1, maxiter+1):
+        if (nit-1) % metric_step == 0:
+            metric = qng_metric(x, statein, vcirc, blocks)
+            metric += reg*np.eye(len(metric))
+        g = grad(x)
+        if recorder is not None:
+            recorder.record_gradient(x, sign*g)
+        x = x - lr*np.linalg.solve(metric, g)
+        f_new = fun(x)
+        nfev += 1
+        if callback is not None:
+            callback(x)
+        if abs(f - f_new) < tol:
+            f = f_new
+            success = True
+            break
+        f = f_new
+
+    message = "Optimization terminated successfully." if success \
+        else "Maximum number of iterations has been exceeded."
+    return OptimizeResult(x=x, fun=f, jac=g, nit=nit, nfev=nfev,
+        success=success, message=message)
+
+def qng_minimize(
+        x0,
+        statein,
+        vcirc: Vcirc,
+        test_func=sep_purity,
+        *args,
+        targets=None,
+        recorder=None,
+        lr=0.05, reg=1e-3, metric_step=1, blocks="ansatz",
+        jac=None, eps=1e-6, maxiter=200, tol=1e-8, callback=None):
+    """
+    Minimize with the quantum natural gradient.
+
+    Each step is `x -= lr * (g + reg)^-1 grad`, where `g` is the
+    block-diagonal metric from `qng_metric`, recomputed every `metric_step`
+    steps. The gradient is given by `jac` or by central finite differences.
+    """
+    fun = lambda x: __evaluate(x,statein,vcirc,test_func,None,args,
+                                targets=targets,recorder=recorder)
+    return __natural_gradient(fun, x0, statein, vcirc, jac, lr, reg,
+        metric_step, blocks, eps, maxiter, tol, callback, recorder)
+
+def qng_maximize(
+        x0,
+        statein,
+        vcirc: Vcirc,
+        test_func=sep_purity,
+        *args,
+        targets=None,
+        recorder=None,
+        lr=0.05, reg=1e-3, metric_step=1, blocks="ansatz",
+        jac=None, eps=1e-6, maxiter=200, tol=1e-8, callback=None):
+    """
+    Maximize with the quantum natural gradient, see `qng_minimize`.
+    `jac` is the gradient of the objective to be maximized.
+    """
+    fun = lambda x: -__evaluate(x,statein,vcirc,test_func,None,args,
+                                 targets=targets,recorder=recorder)
+    neg_jac = None if jac is None else (lambda x: -np.asarray(jac(x)))
+    res = __natural_gradient(fun, x0, statein, vcirc, neg_jac, lr, reg,
+        metric_step, blocks, eps, maxiter, tol, callback, recorder, -1)
+    res.fun = -res.fun
+    res.jac = -res.jac
+    return res
+
+############ Trace ##################
+
+_trace_magic = b"VQCTRACE"
+_trace_version = 1
+_trace_header = 64      # bytes before the records
+
+def trace_dtype(num_paras:int) -> np.dtype:
+    """
+    The record of one evaluation: index of the evaluation, parameters,
+    objective, norm of the gradient (NaN if unknown) and the time in seconds
+    spent to update the parameters, to simulate and to evaluate the
+    objective.
+    """
+    return np.dtype([
+        ("eval", np.int64),
+        ("x", np.float64, (num_paras,)),
+        ("fun", np.float64),
+        ("grad_norm", np.float64),
+        ("t_update", np.float64),
+        ("t_simulate", np.float64),
+        ("t_objective", np.float64),
+    ])
+
+class TraceRecorder:
+    """
+    Stream the evaluations of an optimization to a binary file.
+
+    The records are buffered and appended to the file in chunks of
+    `chunk_size` records, so the memory used does not grow with the length
+    of the run. The file can be read with `read_trace` during or after the
+    run. An existing trace with the same number of parameters is continued,
+    the indices of the evaluations following the last record. The buffered
+    records are written by `close` (or at the end of a `with` block), or
+    when the recorder is garbage collected.
+
+    Pass the recorder to `circ_minimize`, `circ_maximize`, `qng_minimize` or
+    `qng_maximize` as `recorder`.
+
+    Parameters
+    ----------
+    path: str
+        The trace file.
+    num_paras: int
+        Number of parameters of the circuit.
+    chunk_size: int
+        Number of records written at once.
+    every: int
+        Keep one evaluation out of `every`.
+
+    Notes
+    -----
+    The norm of a gradient is stored in the last record at the same
+    parameters, if this record is kept and not yet written to the file.
+    The gradients are only known to the recorder in `qng_minimize` and
+    `qng_maximize`, or if `jac` is a function in `circ_minimize` and
+    `circ_maximize`. Otherwise, e.g. with the finite differences of scipy,
+    the norms are NaN and the evaluations of the finite differences are
+    recorded as evaluations.
+    """
+    def __init__(self, path:str, num_paras:int, chunk_size:int = 1024,
+            every:int = 1):
+        self.__file = None
+        if chunk_size < 1 or every < 1:
+            raise ValueError("chunk_size and every must be positive.")
+        self.path = path
+        self.num_paras = num_paras
+        self.every = every
+        self.dtype = trace_dtype(num_paras)
+
+        self.__buffer = np.zeros(chunk_size, dtype=self.dtype)
+        self.__size = 0         # records in the buffer
+        self.__evals = 0        # evaluations seen
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            if _read_header(path) != num_paras:
+                raise ValueError(f"The trace {path} does not record \
+{num_paras} parameters.")
+            # Drop a partial record left by an interrupted flush
+            count = (os.path.getsize(path) - _trace_header) // self.dtype.itemsize
+            os.truncate(path, _trace_header + count*self.dtype.itemsize)
+            trace = read_trace(path)
+            if len(trace) > 0:
+                self.__evals = int(trace["eval"][-1]) + 1
+            del trace
+            self.__file = open(path, "ab")
+        else:
+            self.__file = open(path, "wb")
+            header = _trace_magic + np.array([_trace_version, num_paras],
+                                             dtype=np.int64).tobytes()
+            self.__file.write(header.ljust(_trace_header, b"\0"))
+            self.__file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def record(self, x, fun, timings=(np.nan, np.nan, np.nan)):
+        """
+        Record an evaluation.
+
+        Parameters
+        ----------
+        x: array
+            The parameters.
+        fun: float
+            The value of the objective.
+        timings: tuple
+            Time spent to update, simulate and evaluate the objective.
+        """
+        index = self.__evals
+        self.__evals += 1
+        if index % self.every != 0:
+            return
+        if self.__size == len(self.__buffer):
+            self.flush()
+
+        rec = self.__buffer[self.__size]
+        rec["eval"] = index
+        rec["x"] = np.ravel(x)
+        rec["fun"] = fun
+        rec["grad_norm"] = np.nan
+        rec["t_update"], rec["t_simulate"], rec["t_objective"] = timings
+        self.__size += 1
+
+    def record_gradient(self, x, grad):
+        """
+        Store the norm of the gradient at `x`.
+        """
+        x = np.ravel(x)
+        for i in reversed(range(self.__size)):
+            if np.array_equal(self.__buffer[i]["x"], x):
+                self.__buffer[i]["grad_norm"] = np.linalg.norm(grad)
+                return
+
+    def watch(self, jac):
+        """
+        Wrap a gradient function to record the norms of its values.
+        """
+        def wrapped(x, *args):
+            grad = jac(x, *args)
+            self.record_gradient(x, grad)
+            return grad
+        return wrapped
+
+    def flush(self):
+        """
+        Append the buffered records to the file.
+        """
+        if self.__size > 0:
+            self.__file.write(self.__buffer[:self.__size].tobytes())
+            self.__file.flush()
+            self.__size = 0
+
+    def close(self):
+        if self.__file is not None and not self.__file.closed:
+            self.flush()
+            self.__file.close()
+
+def _read_header(path:str) -> int:
+    """The number of parameters of a trace file"""
+    with open(path, "rb") as f:
+        header = f.read(_trace_header)
+    if len(header) < _trace_header or not header.startswith(_trace_magic):
+        raise ValueError(f"{path} is not a trace file.")
+    version, num_paras = np.frombuffer(header[len(_trace_magic):
+                                              len(_trace_magic)+16], np.int64)
+    if version != _trace_version:
+        raise ValueError(f"Unsupported trace version {version}.")
+    return int(num_paras)
+
+def read_trace(path:str) -> np.ndarray:
+    """
+    Read a trace written by `TraceRecorder`.
+
+    The records are memory-mapped, nothing is loaded until a field or a
+    slice is accessed, e.g. `read_trace(path)["fun"][::100]`.
+
+    Return
+    ------
+        A read-only structured array with the fields of `trace_dtype`.
+    """
+    dtype = trace_dtype(_read_header(path))
+    count = (os.path.getsize(path) - _trace_header) // dtype.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=_trace_header,
+                     shape=(count,))
@@ -0,0 +1,101 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+_config = {
+    "workers": 1,           # serial by default
+    "threshold": 2**16,     # minimal number of elements for threads
+}
+_pool = None
+
+
+def set_threads(workers:int = None, threshold:int = None):
+    """
+    Configure the threaded kernels.
+
+    The kernels split the amplitudes of a state into independent blocks,
+    which are processed by a thread pool. NumPy releases the GIL in the
+    products, so the blocks run in parallel.
+
+    Parameters
+    ----------
+    workers: int
+        Number of threads. `None` for the number of CPUs, 1 to disable.
+    threshold: int
+        Arrays with fewer elements are processed serially.
+    """
+    global _pool
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError("The number of workers must be positive.")
+    if workers != _config["workers"] and _pool is not None:
+        _pool.shutdown()
+        _pool = None
+    _config["workers"] = workers
+    if threshold is not None:
+        _config["threshold"] = threshold
+
+def get_threads() -> dict:
+    """
+    The configuration of the threaded kernels.
+    """
+    return dict(_config)
+
+def enabled(size:int) -> bool:
+    """
+    Whether an array of `size` elements is processed by threads.
+    """
+    return _config["workers"] > 1 and size >= _config["threshold"]
+
+def _blocks(n:int) -> list:
+    """Split range(n) into one contiguous slice per worker"""
+    bounds = np.linspace(0, n, min(_config["workers"], n) + 1).astype(int)
+    return [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+def _map(func, blocks:list) -> list:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(_config["workers"])
+    return list(_pool.map(func, blocks))
+
+def matmul(op:np.ndarray, mat:np.ndarray) -> np.ndarray:
+    """
+    `op @ mat`, the columns of `mat` being split between the threads, or
+    the rows of `op` if `mat` has fewer columns than threads, e.g. a ket.
+    """
+    if not enabled(max(op.size, mat.size)):
+        return op @ mat
+
+    out = np.empty((op.shape[0], mat.shape[1]),
+                   dtype=np.result_type(op, mat))
+    if mat.shape[1] >= _config["workers"]:
+        def kernel(block):
+            np.matmul(op, mat[:, block], out=out[:, block])
+        _map(kernel, _blocks(mat.shape[1]))
+    else:
+        def kernel(block):
+            np.matmul(op[block], mat, out=out[block])
+        _map(kernel, _blocks(op.shape[0]))
+    return out
+
+def reduce(func, *mats, axis:int = 1):
+    """
+    Sum of `func` over blocks of the arrays `mats` along `axis`.
+
+    `func(*blocks)` must be additive over the blocks, e.g. a partial sum or
+    a partial product `block @ block.conj().T`.
+    """
+    n = mats[0].shape[axis]
+    if not enabled(max(mat.size for mat in mats)) or n < 2:
+        return func(*mats)
+
+    def kernel(block):
+        blocks = []
+        for mat in mats:
+            index = [slice(None)]*mat.ndim
+            index[axis] = block
+            blocks.append(mat[tuple(index)])
+        return func(*blocks)
+    return sum(_map(kernel, _blocks(n)))
@@ -0,0 +1,268 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from .vcirc.batch import BatchSimulator, structure_key
+from .measure.measure_sim import sep_purity
+
+if TYPE_CHECKING:
+    from .vcirc.base import Vcirc
+
+
+class EvaluationService:
+    """
+    Local service evaluating variational circuits in batches.
+
+    Requests (parameters, input state, objective) are queued. The requests
+    arriving within `window` seconds of each other are coalesced, and those
+    on circuits with the same structure and inputs of the same type are
+    simulated together by a `BatchSimulator`. The objectives are then
+    evaluated and the futures of the requests are resolved.
+
+    The circuits of the requests are only used as templates, their
+    parameters are not updated.
+
+    The service runs in an event loop, either the running one with
+    `async with EvaluationService() as service`, or in a background thread
+    with `with EvaluationService() as service` (or `start`/`stop`). In the
+    latter case, `objective` gives a synchronous function which can be used
+    as `fun` for `scipy.optimize.minimize` from several threads. Closing the
+    service fails the pending requests with a `RuntimeError`.
+
+    Parameters
+    ----------
+    window: float
+        Time in seconds to wait for more requests before a batch is run.
+    max_batch: int
+        Maximal number of requests in a batch.
+    """
+    def __init__(self, window:float = 1e-3, max_batch:int = 64):
+        self.window = window
+        self.max_batch = max_batch
+
+        self.__loop = None
+        self.__queue = None
+        self.__task = None
+        self.__thread = None
+        self.__batch = []       # requests being collected
+        self.__simulators = {}  # BatchSimulator of each structure
+
+        self.__requests = 0
+        self.__batch_sizes = []
+        self.__max_depth = 0
+
+    @property
+    def stats(self) -> dict:
+        """
+        Metrics of the service: number of requests and batches, current and
+        maximal queue depth, mean and maximal batch size.
+        """
+        sizes = self.__batch_sizes
+        return {
+            "requests": self.__requests,
+            "batches": len(sizes),
+            "queue_depth": self.__queue.qsize() if self.__queue else 0,
+            "max_queue_depth": self.__max_depth,
+            "mean_batch_size": float(np.mean(sizes)) if sizes else 0.,
+            "max_batch_size": max(sizes) if sizes else 0,
+        }
+
+    ############ Asynchronous interface ##################
+
+    async def __aenter__(self):
+        self.__open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.__close()
+
+    def __open(self):
+        self.__loop = asyncio.get_running_loop()
+        self.__queue = asyncio.Queue()
+        self.__task = self.__loop.create_task(self.__serve())
+
+    async def __close(self):
+        task, self.__task = self.__task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+        # Fail the requests which will never be served
+        pending = self.__batch
+        self.__batch = []
+        while not self.__queue.empty():
+            pending.append(self.__queue.get_nowait())
+        for request in pending:
+            if not request[6].done():
+                request[6].set_exception(RuntimeError("service stopped"))
+
+    async def evaluate(self, x, statein, vcirc:Vcirc, test_func=sep_purity,
+            *args):
+        """
+        Evaluate `test_func` on the output of `vcirc` with parameters `x`,
+        as `vcirc_test` does.
+        """
+        if self.__task is None:
+            raise RuntimeError("The service is not running.")
+        future = self.__loop.create_future()
+        self.__requests += 1
+        try:
+            key = structure_key(vcirc)
+            x = self.__check(key, vcirc, x, statein)
+        except Exception as err:    # only this request fails
+            future.set_exception(err)
+        else:
+            await self.__queue.put((key, vcirc, x, statein, test_func, args,
+                future))
+        return await future
+
+    def __check(self, key, vcirc, x, statein):
+        """Validate a request against the simulator of its structure"""
+        from qutip import Qobj
+
+        if not isinstance(statein, Qobj) or statein.type not in \
+                ("ket", "bra", "oper"):
+            raise TypeError("The input must be a quantum state as a Qobj.")
+        if key not in self.__simulators:
+            self.__simulators[key] = BatchSimulator(vcirc)
+        simulator = self.__simulators[key]
+
+        dims = statein.dims[1] if statein.isbra else statein.dims[0]
+        if dims != simulator.dims:
+            raise ValueError(f"Invalid input state, must be a state on \
+{len(simulator.dims)} qubits system.")
+        x = np.ravel(np.asarray(x, dtype=float))
+        if len(x) != simulator.num_paras:
+            raise ValueError(f"{simulator.num_paras} parameters are \
+required, but {len(x)} are provided.")
+        return x
+
+    async def __serve(self):
+        while True:
+            self.__batch = batch = [await self.__queue.get()]
+            self.__max_depth = max(self.__max_depth, self.__queue.qsize() + 1)
+            deadline = self.__loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - self.__loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.__queue.get(),
+                        timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                self.__run(batch)
+            except Exception as err:    # keep serving the next requests
+                for request in batch:
+                    if not request[6].done():
+                        request[6].set_exception(err)
+            self.__batch = []
+
+    def __run(self, batch:list):
+        groups = {}
+        for request in batch:
+            key, statein = request[0], request[3]
+            groups.setdefault((key, statein.type), []).append(request)
+
+        for (key, _), requests in groups.items():
+            self.__batch_sizes.append(len(requests))
+            simulator = self.__simulators[key]
+            try:
+                outs = simulator.run([request[2] for request in requests],
+                                     [request[3] for request in requests])
+            except Exception:
+                # Run the requests one by one, so only the faulty ones fail
+                outs = []
+                for request in requests:
+                    try:
+                        outs.append(simulator.run([request[2]], [request[3]])[0])
+                    except Exception as err:
+                        if not request[6].done():
+                            request[6].set_exception(err)
+                        outs.append(None)
+
+            for out, (_, _, _, _, test_func, args, future) in zip(outs, requests):
+                if future.done():   # cancelled or failed
+                    continue
+                try:
+                    future.set_result(test_func(out, *args))
+                except Exception as err:
+                    future.set_exception(err)
+
+    ############ Synchronous interface ##################
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        """
+        Run the service in a background thread.
+        """
+        if self.__thread is not None:
+            raise RuntimeError("The service is already running.")
+        loop = asyncio.new_event_loop()
+        self.__thread = threading.Thread(target=loop.run_forever, daemon=True)
+        self.__thread.start()
+
+        async def open_service():
+            self.__open()
+        asyncio.run_coroutine_threadsafe(open_service(), loop).result()
+
+    def stop(self):
+        """
+        Stop the background thread. The pending requests fail with a
+        `RuntimeError`.
+        """
+        if self.__thread is None:
+            return
+        loop = self.__loop
+
+        async def close_service():
+            await self.__close()
+            # Let the pending requests raise in their callers
+            tasks = asyncio.all_tasks() - {asyncio.current_task()}
+            await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            asyncio.run_coroutine_threadsafe(close_service(), loop).result()
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            self.__thread.join()
+            loop.close()
+            self.__thread = None
+
+    def submit(self, x, statein, vcirc:Vcirc, test_func=sep_purity, *args):
+        """
+        Submit a request to the background thread.
+
+        Return
+        ------
+            A `concurrent.futures.Future` of the value.
+        """
+        if self.__thread is None:
+            raise RuntimeError("The service is not running in background.")
+        return asyncio.run_coroutine_threadsafe(
+            self.evaluate(x, statein, vcirc, test_func, *args), self.__loop)
+
+    def objective(self, statein, vcirc:Vcirc, test_func=sep_purity, *args,
+            negate:bool = False):
+        """
+        A synchronous objective `f(x)` evaluated by the service, e.g.
+        `minimize(service.objective(statein, vcirc, fid_ref, r_state), x0)`.
+        Set `negate` to maximize.
+        """
+        sign = -1 if negate else 1
+
+        def fun(x):
+            return sign*self.submit(x, statein, vcirc, test_func, *args).result()
+        return fun
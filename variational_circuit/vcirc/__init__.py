@@ -1,2 +1,10 @@
-from .base import Ansatz,Vcirc
-from .structure import regular, local, vcnot_1, vcnot_2, vcnot_3
\ No newline at end of file
+from .._lazy import lazy_attributes
+from .structure import regular, local, vcnot_1, vcnot_2, vcnot_3
+
+# The circuits depend on qutip, which is imported on first use
+__all__ = ["Ansatz", "Vcirc",
+           "regular", "local", "vcnot_1", "vcnot_2", "vcnot_3"]
+__getattr__, __dir__ = lazy_attributes(__name__, {
+    "Ansatz": ".base",
+    "Vcirc": ".base",
+})
@@ -1,9 +1,12 @@
 import numpy as np
 
 import warnings
-from qutip.qip.circuit import QubitCircuit,CircuitSimulator, _para_gates, Gate, Measurement
+from qutip.qip.circuit import QubitCircuit,CircuitSimulator, CircuitResult, _para_gates, Gate
+from qutip.qip.operations.gates import gate_sequence_product
 from qutip import Qobj
 from .structure import regular
+from .placement import Placement
+from .lightcone import LightCone
 
 class Ansatz(QubitCircuit):
     """
@@ -42,6 +45,10 @@ class Ansatz(QubitCircuit):
 
         self.__updated = False # generate unitary only if necessary
         self.__result = None   # Initialize the result
+        self.__operator = None # Local matrix, generate on demand
+        self.__pruned = {}     # Local matrices of subsets of the gates
+        self.placement = None  # Index plan on the register, set by Vcirc
+        self.placed_gates = [] # Gates on the register, set by Vcirc
 
         if pos is None:
             self.pos = list(range(N))
@@ -126,7 +133,8 @@ required, but {len(x)} are provided.")
         else:
             self._sync_para()
         
-        self.__updated = True
+        self.__updated = False # the cached unitary is outdated
+        self.__pruned = {}
 
     @property
     def unitary(self) -> list:
@@ -151,10 +159,56 @@ required, but {len(x)} are provided.")
             Matrix representation of the ansatz.
         """
         self.sim = CircuitSimulator(self, state=None, precompute_unitary=True)
+        if len(self.sim.ops) == 0:  # no gates
+            self.__operator = np.eye(int(np.prod(self.dims or [2]*self.N)),
+                                     dtype=complex)
+        else:
+            self.__operator = gate_sequence_product(self.sim.ops).full()
         self.__updated = True
 
         return self.sim.ops
 
+    @property
+    def operator(self) -> np.ndarray:
+        """
+        The dense matrix of the ansatz on its own subsystems.
+        """
+        if not self.__updated:
+            self.compress()
+
+        return self.__operator
+
+    def sub_operator(self, gate_li:list, local_pos:list) -> np.ndarray:
+        """
+        The dense matrix of a subset of the gates.
+
+        Parameters
+        ----------
+        gate_li: list
+            The index of the gates, in the order of the circuit.
+        local_pos: list
+            The qubits of the ansatz the gates act on.
+
+        Return
+        ------
+            Matrix of the gates on the qubits `local_pos`.
+        """
+        key = tuple(gate_li)
+        if key not in self.__pruned:
+            qc = QubitCircuit(len(local_pos), user_gates = self.user_gates)
+            for i in gate_li:
+                gate = self.gates[i]
+                targets = [local_pos.index(t) for t in gate.targets]
+                if gate.controls is not None:
+                    controls = [local_pos.index(c) for c in gate.controls]
+                else:
+                    controls = None
+                qc.add_gate(gate.name, targets, controls,
+                            gate.arg_value, gate.arg_label)
+            self.__pruned[key] = gate_sequence_product(qc.propagators()).full()
+
+        return self.__pruned[key]
+
 class Vcirc(QubitCircuit):
     """
     Generate the variational circuit
@@ -171,19 +225,31 @@ class Vcirc(QubitCircuit):
             The input state.
         result: CircuitResult
             The result of the previous run.
+        dtype: numpy.dtype
+            Precision of the simulation, `np.complex128` (default) or
+            `np.complex64`. Single precision halves the memory traffic of the
+            simulation. The objectives of `optimize` pass it as the `dtype`
+            option of the measures, and agree with double precision within
+            1e-6. The output is returned as a `Qobj` in double precision.
     """
     def __init__(self, N:int, user_gates:dict = None,
-            dims:list = None, num_cbits:int = 0):
+            dims:list = None, num_cbits:int = 0, dtype = np.complex128):
 
         QubitCircuit.__init__(self, N, user_gates = user_gates,
                 dims = dims, num_cbits = num_cbits)
+        if self.dims is None:
+            self.dims = [2]*N   # qubits system by default
 
         self.ansatzes = []
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.complex64, np.complex128):
+            raise ValueError("dtype must be np.complex64 or np.complex128.")
 
-        self.sim = None     # Generate on demand
+        self.__ops = None   # Generate on demand
 
         self.__updated = False # generate unitary only if necessary
         self.__result = None   # Initialize the result
+        self.__cones = {}      # Light cones of the targets, generate on demand
 
         self.statein = None    # Initialize the input state
     
@@ -215,52 +281,148 @@ class Vcirc(QubitCircuit):
         if not self.__updated:
             return self.compress()
         else:
-            return self.sim.ops
+            return self.__ops
 
     @property
     def result(self):
-        if not self.__updated:
-            self.compress()
+        if self.__result is None and self.statein is not None:
+            self.apply_to()
             
         return self.__result
 
+    @property
+    def sim(self):
+        """
+        Deprecated, the circuit is simulated by `apply_to` without a
+        `CircuitSimulator`. A simulator of the gates is built on access.
+        """
+        warnings.warn("`Vcirc.sim` is deprecated, use `apply_to` and \
+`unitary` instead.", DeprecationWarning, stacklevel=2)
+        if not self.__updated:
+            self.compress()
+        return CircuitSimulator(self, state=self.statein,
+                                precompute_unitary=True)
+
     def compress(self,ansatz_li:list = []) -> list:
         """
         Get the matrix of the variational circuit
 
+        The local operators of the ansatzes are placed on the register with
+        the index plans computed in `add_ansatz`. The gates of the ansatzes
+        are listed in `gates` on the qubits of the register, for inspection
+        only, the simulation does not use them.
+
         Return
         ------
             Matrix representation of the variational circuit.
         """
         if len(ansatz_li) == 0:
             self.gates = []
+            dim = int(np.prod(self.dims))
+            mat = np.eye(dim, dtype=self.dtype)
             for ansatz in self.ansatzes:
-                self.add_circuit(self.__permute_circuit(ansatz,ansatz.pos))
-            self.sim = CircuitSimulator(self, state=self.statein, precompute_unitary=True)
+                self.gates += self.__placed_gates(ansatz)
+                mat = ansatz.placement.apply(ansatz.operator, mat)
+            self.__ops = [Qobj(mat, dims=[self.dims, self.dims])]
             self.__updated = True
 
-            return self.sim.ops
+            return self.__ops
         else:
             return [self.ansatzes[i].compress()[0] for i in ansatz_li]
 
-    def apply_to(self,statein:Qobj = None,stat:bool = False):
+    def __placed_gates(self, ansatz:Ansatz) -> list:
         """
-        Apply the circuit to a state.
-        Return the quantum state if `stat` is `False` and return the ensemble
-        of the computational basis measurements is `stat` is `True`.
+        The gates of an ansatz on the qubits of the register. The gates are
+        mapped once, only their parameters are updated afterwards.
         """
-        if not self.__updated:
-            self.compress()
+        if len(ansatz.placed_gates) == len(ansatz.gates):
+            for gate, op in zip(ansatz.placed_gates, ansatz.gates):
+                gate.arg_value = op.arg_value
+            return ansatz.placed_gates
+
+        pos = ansatz.pos
+        gates = []
+        for op in ansatz.gates:
+            targets = None if op.targets is None else \
+                [pos[target] for target in op.targets]
+            controls = None if op.controls is None else \
+                [pos[control] for control in op.controls]
+            gates.append(Gate(op.name, targets, controls, op.arg_value,
+                              op.arg_label))
+        ansatz.placed_gates = gates
+        return gates
+
+    def light_cone(self, targets:list) -> LightCone:
+        """
+        The backward causal cone of the qubits `targets`.
+        The analysis only depends on the structure and is cached.
+        """
+        key = tuple(sorted(set(targets)))
+        if key not in self.__cones:
+            self.__cones[key] = LightCone(self.ansatzes, self.dims, key)
+        return self.__cones[key]
 
-        if statein != None:
-                self.sim.initialize(state=statein)
-        
+    def apply_to(self,statein:Qobj = None,stat:bool = False,
+            targets:list = None):
+        """
+        Apply the circuit to a state.
+
+        The ansatzes are applied one by one on their own subsystems, so the
+        cost of each ansatz scales with its size instead of the register.
+        The circuit contains no measurement, so the ensemble returned by
+        `result` holds the single output state. `stat` is deprecated.
+
+        If `targets` is given, only the gates in the light cone of `targets`
+        are simulated, and the reduced density matrix of `targets` (in
+        increasing order) is returned. The input is reduced to the qubits
+        the light cone can reach only if this is cheaper than simulating the
+        pure state on the whole register.
+        """
+        if statein is None:
+            statein = self.statein
+        if statein is None:
+            raise ValueError("No input state is given.")
         if stat:
-            self.__result = self.sim.run_statistics(statein)
+            warnings.warn("`stat` is deprecated and has no effect: the \
+circuit contains no measurement, so `result` holds the single output state.",
+                DeprecationWarning, stacklevel=2)
+
+        if targets is None:
+            state = statein.full().astype(self.dtype, copy=False)
+            for ansatz in self.ansatzes:
+                state = ansatz.placement.evolve(ansatz.operator, state,
+                    statein.type)
+            stateout = Qobj(state, dims=statein.dims)
         else:
-            self.__result = self.sim.run(statein)
+            cone = self.light_cone(targets)
+            reduced = statein.dag() if statein.isbra else statein
+            # The reduced input is a density matrix, only worth it for a
+            # small support when the input is a pure state
+            reduce = len(cone.support) < self.N and \
+                (reduced.isoper or 2*len(cone.support) <= self.N)
+            if reduce:
+                reduced = reduced.ptrace(cone.support)
+                support = cone.support
+            else:
+                support = list(range(self.N))
+            state = reduced.full().astype(self.dtype, copy=False)
+            for i, gate_li, local_pos, placement, register in cone.plan:
+                ansatz = self.ansatzes[i]
+                if gate_li is None:
+                    op = ansatz.operator
+                else:
+                    op = ansatz.sub_operator(gate_li, local_pos)
+                if not reduce:
+                    placement = register
+                state = placement.evolve(op, state, reduced.type)
+            stateout = Qobj(state, dims=reduced.dims)
+            if cone.targets != support or stateout.isket:
+                stateout = stateout.ptrace(
+                    [support.index(t) for t in cone.targets])
+
+        self.__result = CircuitResult(stateout, 1.)
 
-        return self.__result.get_final_states()[0]
+        return stateout
 
     def add_ansatz(self,x,structure=regular,pos=None,index=None,**arg_value):
         """
@@ -284,14 +446,21 @@ class Vcirc(QubitCircuit):
             size = self.N
         else:
             size = len(pos)
+        placement = Placement(self.dims, pos)   # index plan of the ansatz
         if index is None:
-            self.ansatzes.append(Ansatz(x, size, structure=structure,
-            pos=pos, **arg_value))
+            ansatz = Ansatz(x, size, structure=structure, pos=pos, **arg_value)
+            ansatz.placement = placement
+            self.__placed_gates(ansatz)
+            self.ansatzes.append(ansatz)
         else:
             for position in index:
-                self.ansatzes.insert(position,Ansatz(x, size,
-                structure=structure, pos=pos,**arg_value))
+                ansatz = Ansatz(x, size, structure=structure, pos=pos,
+                    **arg_value)
+                ansatz.placement = placement
+                self.__placed_gates(ansatz)
+                self.ansatzes.insert(position,ansatz)
         self.__updated = False
+        self.__cones = {}
 
     def remove_ansatz(self,index=None,end=None,name=None,remove="first"):
         """
@@ -340,6 +509,7 @@ class Vcirc(QubitCircuit):
         else:
             self.ansatzes.pop()
         self.__updated = False
+        self.__cones = {}
 
     def update_ansatzes(self,x_in,ansatz_li=None):
         """
@@ -378,46 +548,3 @@ class Vcirc(QubitCircuit):
         else:
             raise TypeError("ansatz_li must be a list of indexes.")
         self.__updated = False
-    
-    # FIXME: Override the add_circuit function in QubitCircuit
-    def __permute_circuit(self, qc2add:QubitCircuit, pos=None) -> QubitCircuit:
-        """
-        Adds a block of a qubit circuit to the main circuit.
-        Globalphase gates are not added.
-
-        Parameters
-        ----------
-        qc2add : QubitCircuit
-            The circuit block to be added to the main circuit.
-        pos : list
-            The arrangement of qubits.
-        """
-        if pos is None:        # For default positions, add the circuit directly
-            return qc2add
-        
-        if max(pos) >= self.N or min(pos) < 0:
-            raise IndexError("Qubit allocated outside the circuit")
-            
-        temp_qc = QubitCircuit(self.N)
-
-        for op in qc2add.gates:
-            if op.targets is not None:
-                temp_tar = [pos[target] for target in op.targets]
-            else:
-                temp_tar = None
-
-            if isinstance(op, Gate):
-                if op.controls is not None:
-                    temp_ctrl = [pos[control] for control in op.controls]
-                else:
-                    temp_ctrl = None
-                temp_qc.add_gate(op.name, temp_tar, temp_ctrl,
-                                 op.arg_value,op.arg_label)
-            elif isinstance(op, Measurement):
-                self.add_measurement(
-                    op.name, temp_tar,
-                    classical_store=op.classical_store)
-            else:
-                raise TypeError("The circuit to be added contains unknown \
-                    operator {}".format(op))
-        return temp_qc
\ No newline at end of file
@@ -0,0 +1,98 @@
+import numpy as np
+
+from .gates import gate_qubits, gate_matrix, rotations
+from .placement import Placement
+
+
+def structure_key(vcirc) -> tuple:
+    """
+    A hashable description of the structure of a variational circuit.
+    Circuits with the same key only differ by their parameters.
+    """
+    key = [tuple(vcirc.dims), str(vcirc.dtype)]
+    for ansatz in vcirc.ansatzes:
+        gates = tuple((gate.name, tuple(gate.targets or ()),
+                       tuple(gate.controls or ()),
+                       gate.arg_value if gate.arg_value is None
+                       or len(ansatz.paras) == 0 else "para")
+                      for gate in ansatz.gates)
+        key.append((tuple(ansatz.pos), len(ansatz.paras), gates))
+    return tuple(key)
+
+class BatchSimulator:
+    """
+    Simulate a variational circuit for a batch of parameters and inputs.
+
+    The gates of the circuit are applied one by one to all the states of the
+    batch at once. The parameterized gates are built from their generators
+    for the whole batch, the other gates are computed once.
+
+    Parameters
+    ----------
+    vcirc: Vcirc
+        The template circuit. Only its structure is used.
+    """
+    def __init__(self, vcirc):
+        self.key = structure_key(vcirc)
+        self.dims = list(vcirc.dims)
+        self.dtype = vcirc.dtype
+
+        self.plan = []      # list of (placement, matrix or name, parameter)
+        head = 0
+        for ansatz in vcirc.ansatzes:
+            para = len(ansatz.paras) > 0    # same rule as `update_ansatzes`
+            for gate in ansatz.gates:
+                qubits = [ansatz.pos[q] for q in gate_qubits(gate)]
+                placement = Placement(self.dims, qubits)
+                if para and gate.arg_value is not None:
+                    rotations(gate.name, [0.])  # check the gate is supported
+                    self.plan.append((placement, gate.name, head))
+                    head += 1
+                else:
+                    self.plan.append((placement,
+                        gate_matrix(gate, ansatz.user_gates), None))
+        self.num_paras = head
+
+    def run(self, xs, states:list) -> list:
+        """
+        Apply the circuit to the states.
+
+        Parameters
+        ----------
+        xs: array
+            Parameters of shape (B, num_paras), in the order of
+            `Vcirc.update_ansatzes`.
+        states: list
+            B input states of the same type.
+
+        Return
+        ------
+            The list of output states.
+        """
+        from qutip import Qobj
+
+        xs = np.asarray(xs, dtype=float).reshape(len(states), -1)
+        if xs.shape[1] != self.num_paras:
+            raise ValueError(f"{self.num_paras} parameters are required, \
+but {xs.shape[1]} are provided.")
+        kind = states[0].type
+        if any(state.type != kind for state in states):
+            raise ValueError("The states of a batch must be of the same type.")
+
+        mats = np.stack([state.full() for state in states]).astype(self.dtype)
+        if kind == "bra":
+            mats = mats.conj().transpose(0, 2, 1)
+
+        for placement, gate, head in self.plan:
+            if head is None:
+                ops = np.broadcast_to(gate, (len(states),) + gate.shape)
+            else:
+                ops = rotations(gate, xs[:, head])
+            mats = placement.apply_batch(ops, mats)
+            if kind == "oper":
+                mats = placement.apply_batch(ops, mats.conj().transpose(0, 2, 1))
+                mats = mats.conj().transpose(0, 2, 1)
+
+        if kind == "bra":
+            mats = mats.conj().transpose(0, 2, 1)
+        return [Qobj(mat, dims=state.dims) for mat, state in zip(mats, states)]
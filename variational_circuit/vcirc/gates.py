@@ -0,0 +1,63 @@
+import numpy as np
+
+_sigma_x = np.array([[0, 1], [1, 0]])
+_sigma_y = np.array([[0, -1j], [1j, 0]])
+_sigma_z = np.array([[1, 0], [0, -1]])
+_proj_1 = np.array([[0, 0], [0, 1]])
+
+# Generators K of the parameterized gates, U(x) = exp(-i x K),
+# on the qubits (controls + targets)
+generators = {
+    "RX": _sigma_x/2,
+    "RY": _sigma_y/2,
+    "RZ": _sigma_z/2,
+    "CRX": np.kron(_proj_1, _sigma_x/2),
+    "CRY": np.kron(_proj_1, _sigma_y/2),
+    "CRZ": np.kron(_proj_1, _sigma_z/2),
+    "PHASEGATE": -_proj_1,
+    "CPHASE": -np.kron(_proj_1, _proj_1),
+}
+
+def gate_qubits(gate) -> list:
+    """
+    The qubits of a gate, controls first.
+    """
+    return list(gate.controls or []) + list(gate.targets or [])
+
+def gate_matrix(gate, user_gates:dict = None) -> np.ndarray:
+    """
+    The matrix of a gate on its own qubits, in the order of `gate_qubits`.
+    """
+    from qutip.qip.circuit import QubitCircuit
+
+    qubits = gate_qubits(gate)
+    local = {q: i for i, q in enumerate(qubits)}
+    targets = [local[q] for q in gate.targets]
+    if gate.controls is not None:
+        controls = [local[q] for q in gate.controls]
+    else:
+        controls = None
+    qc = QubitCircuit(len(qubits), user_gates = user_gates)
+    qc.add_gate(gate.name, targets, controls, gate.arg_value, gate.arg_label)
+    return qc.propagators()[0].full()
+
+def rotations(name:str, angles) -> np.ndarray:
+    """
+    Matrices exp(-i x K) of a parameterized gate for a batch of angles.
+
+    Parameters
+    ----------
+    name: str
+        Name of the gate, a key of `generators`.
+    angles: array
+        The angles x, of shape (B,).
+
+    Return
+    ------
+        Array of shape (B, d, d).
+    """
+    if name not in generators:
+        raise ValueError(f"The gate {name} is not supported.")
+    eigvals, eigvecs = np.linalg.eigh(generators[name])
+    phases = np.exp(-1j*np.outer(angles, eigvals))
+    return (eigvecs[None, :, :]*phases[:, None, :]) @ eigvecs.conj().T
@@ -0,0 +1,73 @@
+from .placement import Placement
+from .gates import gate_qubits
+
+
+class LightCone:
+    """
+    Backward causal cone of a list of ansatzes.
+
+    Starting from the qubits read by the objective, the gates are visited
+    from the end of the circuit. A gate is kept only if it touches the cone,
+    in which case its qubits join the cone. The other gates act on qubits
+    that are traced out afterwards and do not change the reduced state.
+
+    Parameters
+    ----------
+    ansatzes: list
+        The ansatzes of the circuit, with their placements.
+    dims: list
+        Dimension of each composite system of the register.
+    targets: list
+        The subsystems read by the objective.
+
+    Attributes
+    ----------
+    support: list
+        The subsystems of the input that can influence the targets.
+    plan: list
+        Tuples (`index_of_ansatz`, `gate_li`, `local_pos`, `placement`,
+        `register`) in the order of evolution. `gate_li` is `None` if the
+        whole ansatz is kept and all its qubits are used, `local_pos` are the
+        positions of the kept gates in the ansatz, `placement` places them on
+        the support and `register` on the whole register.
+    """
+    def __init__(self, ansatzes:list, dims:list, targets:list):
+        N = len(dims)
+        if len(targets) == 0 or max(targets) >= N or min(targets) < 0:
+            raise IndexError("Target qubits outside the circuit")
+
+        self.targets = sorted(set(targets))
+        cone = set(self.targets)
+
+        kept = []
+        for i in reversed(range(len(ansatzes))):
+            ansatz = ansatzes[i]
+            gate_li = []
+            for j in reversed(range(len(ansatz.gates))):
+                qubits = {ansatz.pos[q] for q in gate_qubits(ansatz.gates[j])}
+                if qubits & cone:
+                    cone |= qubits
+                    gate_li.append(j)
+            if len(gate_li) > 0:
+                kept.append((i, gate_li[::-1]))
+
+        self.support = sorted(cone)
+        sub_dims = [dims[q] for q in self.support]
+
+        self.plan = []
+        for i, gate_li in reversed(kept):
+            ansatz = ansatzes[i]
+            touched = set()
+            for j in gate_li:
+                touched.update(gate_qubits(ansatz.gates[j]))
+            local_pos = sorted(touched)
+            # Idle qubits of the ansatz may lie outside the support
+            if len(gate_li) == len(ansatz.gates) and len(touched) == ansatz.N:
+                gate_li = None
+            placement = Placement(sub_dims,
+                [self.support.index(ansatz.pos[q]) for q in local_pos])
+            if gate_li is None:
+                register = ansatz.placement
+            else:
+                register = Placement(dims, [ansatz.pos[q] for q in local_pos])
+            self.plan.append((i, gate_li, local_pos, placement, register))
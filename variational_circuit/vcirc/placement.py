@@ -0,0 +1,114 @@
+import numpy as np
+
+from ..parallel import matmul
+
+
+class Placement:
+    """
+    Index plan placing a local operator on a subset of the register.
+
+    The plan is computed once, and applying an operator only reorders the
+    axes of the state, so the cost scales with the size of the local operator
+    instead of the whole register. The products run on the threads set by
+    `variational_circuit.parallel.set_threads`.
+
+    Parameters
+    ----------
+    dims: list
+        Dimension of each composite system of the register.
+    pos: list
+        The subsystems the local operator acts on. If `None`, the whole
+        register in natural order.
+    """
+    def __init__(self, dims:list, pos:list = None):
+        self.dims = list(dims)
+        N = len(self.dims)
+
+        if pos is None:
+            pos = list(range(N))
+        if len(pos) == 0 or max(pos) >= N or min(pos) < 0:
+            raise IndexError("Qubit allocated outside the circuit")
+        if len(set(pos)) != len(pos):
+            raise ValueError("Repeated qubits in the position list.")
+
+        self.pos = list(pos)
+        rest = [i for i in range(N) if i not in self.pos]
+
+        self.perm = self.pos + rest             # local axes to the front
+        self.inv = list(np.argsort(self.perm))  # back to natural order
+        self.local_dim = int(np.prod([self.dims[i] for i in self.pos]))
+        self.total_dim = int(np.prod(self.dims))
+        self.natural = self.perm == list(range(N))
+
+    def apply(self, op:np.ndarray, mat:np.ndarray) -> np.ndarray:
+        """
+        Left multiply the local operator on the register index of `mat`.
+
+        Parameters
+        ----------
+        op: ndarray
+            Local operator of shape (local_dim, local_dim).
+        mat: ndarray
+            Array of shape (total_dim, m), e.g. a ket or a density matrix.
+
+        Return
+        ------
+            The array with `op` applied on the subsystems `pos`, in the
+            precision of `mat`.
+        """
+        op = op.astype(mat.dtype, copy=False)
+        m = mat.shape[1]
+        if self.natural:
+            # Local axes already lead, only the remaining axes are batched
+            out = matmul(op, mat.reshape(self.local_dim, -1))
+            return out.reshape(self.total_dim, m)
+
+        N = len(self.dims)
+        tensor = mat.reshape(self.dims + [m]).transpose(self.perm + [N])
+        out = matmul(op, tensor.reshape(self.local_dim, -1))
+        out = out.reshape([self.dims[i] for i in self.perm] + [m])
+        return out.transpose(self.inv + [N]).reshape(self.total_dim, m)
+
+    def apply_batch(self, ops:np.ndarray, mats:np.ndarray) -> np.ndarray:
+        """
+        `apply` for a batch of operators and arrays.
+
+        Parameters
+        ----------
+        ops: ndarray
+            Local operators of shape (B, local_dim, local_dim).
+        mats: ndarray
+            Arrays of shape (B, total_dim, m).
+        """
+        ops = ops.astype(mats.dtype, copy=False)
+        B, _, m = mats.shape
+        N = len(self.dims)
+        axes = [0] + [i+1 for i in self.perm] + [N+1]
+        tensor = mats.reshape([B] + self.dims + [m]).transpose(axes)
+        out = ops @ tensor.reshape(B, self.local_dim, -1)
+        out = out.reshape([B] + [self.dims[i] for i in self.perm] + [m])
+        axes = [0] + [i+1 for i in self.inv] + [N+1]
+        return out.transpose(axes).reshape(B, self.total_dim, m)
+
+    def evolve(self, op:np.ndarray, state:np.ndarray, kind:str = "ket") -> np.ndarray:
+        """
+        Evolve a state with the local unitary.
+
+        Parameters
+        ----------
+        op: ndarray
+            Local unitary.
+        state: ndarray
+            Full matrix of the state.
+        kind: str
+            Type of the state, "ket", "bra" or "oper".
+        """
+        if kind == "ket":
+            return self.apply(op, state)
+        elif kind == "bra":
+            return self.apply(op, state.conj().T).conj().T
+        elif kind == "oper":
+            half = self.apply(op, state)                    # U rho
+            return self.apply(op, half.conj().T).conj().T   # U rho U^dag
+        else:
+            raise ValueError("The input should be a quantum state")